@@ -2,37 +2,310 @@
 Utility functions for the coding stylistic extractor.
 """
 
+import argparse
+import asyncio
+import functools
+import gzip
+import hashlib
+import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set
 
 import anthropic
 from dotenv import load_dotenv
 
+# Optional faster JSON backend for the caches
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional dependencies for the semantic cache
+try:
+    import numpy as np
+    import voyageai
+except ImportError:
+    np = None
+    voyageai = None
+
 # Loads environment variables from a .env file
 load_dotenv()
 
+# Coding stylistic extraction prompt declaration, split around the samples
+_CODE_PROMPT_PREFIX = """I want you to analyze these Python files from a coding samples repository and create a comprehensive coding style guide.
+
+IMPORTANT: These files are SAMPLES of my personal coding style. The specific application context is NOT part of my coding style. Focus ONLY on the coding patterns, conventions, and formatting choices that are consistent across all samples, regardless of what the code does.
+
+Your task is to:
+
+1. **Identify patterns and conventions** that appear consistently across all files
+2. **Create a detailed markdown style guide** that captures my personal and distinctive coding style patterns
+3. **Include specific snippet examples** from my actual code showing the STYLE, not the application logic
+4. **Make it prescriptive** so another AI could replicate my style exactly when writing ANY type of Python code
+
+Analyze these aspects:
+
+**Documentation:**
+- Docstring format (Google/NumPy/Sphinx style?)
+- What sections do I include? (Args, Returns, etc.)
+- Level of detail in docstrings
+- Module-level documentation patterns
+- How I describe parameters and return values
+
+**Type Hints:**
+- Where and when do I use type annotations?
+- Always on function signatures? Sometimes on variables?
+- Complex types (Union, Optional, List, Dict patterns)
+
+**Naming Conventions:**
+- Variable naming (length, descriptiveness, patterns)
+- Function naming (verbs, patterns)
+- Class naming
+- Constants (if any)
+- Private/protected members (underscore usage)
+
+**Code Organization:**
+- Import ordering and grouping
+- Class structure (method ordering, organization)
+- File structure patterns
+- Global variables and constants placement
+
+**Comments:**
+- When do I add comments?
+- Inline vs block comments
+- Comment style and detail level
+- What do I explain vs what do I leave uncommented?
+
+**Code Style:**
+- Line length preferences
+- Indentation patterns
+- Blank line usage
+- String quotes (single vs double)
+
+**Python Idioms:**
+- List/dict comprehensions usage
+- Use of decorators
+- Context managers
+- Generators and iterators
+- Exception handling patterns
+
+**Distinctive Patterns:**
+- Any unique or characteristic patterns you notice
+- Preferred libraries or approaches
+- Code complexity preferences
+- How I structure error handling
+- Logging patterns
+
+REMEMBER: Extract only the STYLE patterns that are consistent across samples. Do NOT include application-specific conventions. Focus on HOW I write code, not WHAT the code does.
+
+"""
+
+_CODE_PROMPT_SUFFIX = """
+
+Create a markdown document with clear sections, snippet examples showing STYLE patterns, and actionable rules.
+Format it as a professional style guide that could be given to a coding agent for writing ANY Python code in my style."""
+
+# Coding per-file style feature extraction prompt declaration, wrapped around a single sample
+_CODE_MAP_PROMPT_PREFIX = """Extract the coding style features of this Python file as a compact JSON object. Ignore what the code does and focus ONLY on how it is written.
+
+Use the keys "documentation", "type_hints", "naming", "organization", "comments", "code_style", "idioms" and "distinctive_patterns", each holding a short list of observations, plus "snippets" with up to 3 short verbatim snippets that best show the style.
+
+"""
+
+_CODE_MAP_PROMPT_SUFFIX = """
+
+Respond with the JSON object only."""
+
+def _json_dumps(obj: any) -> bytes:
+    """
+    Serializes an object to JSON, using orjson when it is installed.
+    
+    Args:
+        obj: Object to serialize
+        
+    Returns:
+        UTF-8 encoded JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+
+    return json.dumps(obj).encode("utf-8")
+
+
+def _json_loads(data: bytes) -> any:
+    """
+    Deserializes JSON, using orjson when it is installed.
+    
+    Args:
+        data: UTF-8 encoded JSON
+        
+    Returns:
+        Deserialized object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+
+    return json.loads(data)
+
+
+class SemanticCache:
+    """
+    A cache of previous drafts indexed by the embeddings of their code samples.
+    """
+
+    def __init__(self, cache_dir: Path, threshold: float = 0.95, embedding_model: str = "voyage-3", batch_size: int = 8) -> None:
+        """
+        Initializes the semantic cache and loads any persisted entries.
+        
+        Args:
+            cache_dir: Directory where the embeddings and drafts are persisted
+            threshold: Minimum cosine similarity for a cached draft to be reused
+            embedding_model: Voyage AI model used to embed the code samples
+            batch_size: Number of files embedded per request, keeping each request within the model limits
+        """
+        self.cache_dir = cache_dir
+        self.threshold = threshold
+        self.embedding_model = embedding_model
+        self.batch_size = batch_size
+        self.client = voyageai.Client()
+        self.embeddings_file = cache_dir / "embeddings.npy"
+        self.drafts_file = cache_dir / "drafts.json"
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
+        self.drafts: List[str] = []
+
+        # Loads the persisted entries, discarding them if they were built with another model or pooling
+        if self.embeddings_file.exists() and self.drafts_file.exists():
+            try:
+                sidecar = _json_loads(self.drafts_file.read_bytes())
+
+                if sidecar["embedding_model"] == embedding_model and sidecar.get("pooling") == "file_mean":
+                    self.embeddings = np.load(self.embeddings_file)
+                    self.drafts = sidecar["drafts"]
+            except Exception as e:
+                print(f"Error loading semantic cache, discarding it: {e}")
+                self.embeddings = np.empty((0, 0), dtype=np.float32)
+                self.drafts = []
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        """
+        Embeds each file separately and averages the vectors, so every file stays within the model context.
+        
+        Args:
+            texts: Texts of the individual files to embed
+            
+        Returns:
+            Unit-length mean embedding vector
+        """
+        file_embeddings = []
+
+        for start in range(0, len(texts), self.batch_size):
+            result = self.client.embed(texts[start:start + self.batch_size], model=self.embedding_model, input_type="document")
+            file_embeddings.extend(result.embeddings)
+
+        embeddings = np.asarray(file_embeddings, dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embedding = embeddings.mean(axis=0)
+
+        return embedding / np.linalg.norm(embedding)
+
+    def lookup(self, embedding: "np.ndarray") -> Optional[str]:
+        """
+        Retrieves the draft of the most similar cached entry.
+        
+        Args:
+            embedding: Unit-length embedding of the code samples
+            
+        Returns:
+            Cached draft if its similarity reaches the threshold, None otherwise
+        """
+        if not self.drafts:
+            return None
+
+        similarities = self.embeddings @ embedding
+        best_index = int(np.argmax(similarities))
+        print(f"Closest cached draft similarity: {similarities[best_index]:.3f}")
+
+        if similarities[best_index] < self.threshold:
+            return None
+
+        return self.drafts[best_index]
+
+    def store(self, embedding: "np.ndarray", draft: str) -> None:
+        """
+        Adds a new entry to the cache and persists it.
+        
+        Args:
+            embedding: Unit-length embedding of the code samples
+            draft: Draft generated from the code samples
+        """
+        if self.drafts:
+            self.embeddings = np.vstack([self.embeddings, embedding])
+        else:
+            self.embeddings = embedding[np.newaxis, :]
+        self.drafts.append(draft)
+
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            np.save(self.embeddings_file, self.embeddings)
+            self.drafts_file.write_bytes(_json_dumps({
+                "embedding_model": self.embedding_model,
+                "pooling": "file_mean",
+                "drafts": self.drafts
+            }))
+        except Exception as e:
+            print(f"Error saving semantic cache: {e}")
+
+
 class StylisticExtractorUtils:
     """
     A utility class for handling file operations and API interactions.
     """
     
-    def __init__(self, code_repository_path: str, output_file_path: str) -> None:
+    def __init__(self, code_repository_path: str, output_file_path: str, semantic_cache: bool = False) -> None:
         """
         Initializes the stylistic extractor utility.
         
         Args:
             code_repository_path: Path to the code repository to analyze
             output_file_path: Path where the style guide will be saved
+            semantic_cache: Whether to reuse drafts of near-identical samples from previous runs
         """
         self.repo_path = Path(code_repository_path)
         self.output_file = output_file_path
-        self.client = anthropic.Anthropic(
-            api_key=os.getenv("ANTHROPIC_API_KEY")
-        )
-        self.conversation_history: List[Dict[str, str]] = []
+        self.model = "claude-sonnet-4-20250514"
+        self.max_tokens = 8000
+        self.map_model = "claude-haiku-4-5-20251001"
+        self.map_max_tokens = 800
+        self.cache_dir = Path(".cache") / "stylistic"
+        self.conversation_history: List[Dict[str, any]] = []
         self.current_draft: Optional[str] = None
+        self.semantic_cache: Optional[SemanticCache] = None
+
+        if semantic_cache:
+            if np is None or voyageai is None:
+                print("Semantic cache disabled: numpy and voyageai are required")
+            else:
+                try:
+                    self.semantic_cache = SemanticCache(self.cache_dir / "semantic" / "coding")
+                except Exception as e:
+                    print(f"Semantic cache disabled: {e}")
+
+    @functools.cached_property
+    def client(self) -> anthropic.AsyncAnthropic:
+        """
+        Creates the Anthropic client on first use, so runs that never reach the API skip its setup.
+        
+        Returns:
+            Anthropic client shared by every call of this utility
+        """
+        # Retries rate limits, overloads and server errors with exponential backoff and jitter
+        return anthropic.AsyncAnthropic(
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            max_retries=5
+        )
 
     def scan_repository(self, max_files: int = 20, extensions: List[str] = None) -> List[Path]:
         """
@@ -48,158 +321,380 @@ class StylisticExtractorUtils:
         if extensions is None:
             extensions = [".py"]
             
+        suffixes = tuple(extensions)
         code_files = []
+        pending_dirs = [str(self.repo_path)]
 
-        for ext in extensions:
-            for filepath in self.repo_path.rglob(f'*{ext}'):
-                code_files.append(filepath)
+        # Walks the directory tree once, stopping as soon as enough files are found
+        while pending_dirs and len(code_files) < max_files:
+            directory = pending_dirs.pop()
 
-                if len(code_files) >= max_files:
-                    break
+            try:
+                entries = os.scandir(directory)
+            except OSError as e:
+                print(f"Error scanning {directory}: {e}")
+                continue
+
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending_dirs.append(entry.path)
+                    elif entry.is_file() and entry.name.endswith(suffixes):
+                        code_files.append(Path(entry.path))
+
+                        if len(code_files) >= max_files:
+                            break
         
         print(f"\nFound {len(code_files)} code files in the repository.")
         return code_files
     
-    def read_files(self, filepaths: List[Path]) -> List[Dict[str, any]]:
+    def read_files(self, filepaths: List[Path], max_bytes_per_file: int = 16384, max_total_bytes: int = 524288, duplicate_threshold: float = 0.8) -> List[Dict[str, any]]:
         """
         Reads the content of the provided list of file paths.
         
         Args:
             filepaths: List of Path objects to read
+            max_bytes_per_file: Size above which a file is truncated to its head and tail
+            max_total_bytes: Size budget for all files combined, enforced by dropping the largest files
+            duplicate_threshold: Shingle Jaccard similarity above which a file is considered a near-duplicate
             
         Returns:
             List of dictionaries containing file path, content, and line count
         """
-        samples = []
-        total_lines = 0
+        if not filepaths:
+            return []
+
+        # Reads the files concurrently, preserving their original order
+        with ThreadPoolExecutor(max_workers=min(32, len(filepaths))) as executor:
+            samples = [
+                sample
+                for sample in executor.map(self._read_one, filepaths, [max_bytes_per_file] * len(filepaths))
+                if sample is not None
+            ]
+
+        # Drops exact and near-duplicate files, keeping the first file of each cluster
+        unique_samples = []
+        seen_hashes = set()
+        kept_shingles = []
+
+        for sample in samples:
+            content_hash = hashlib.sha256(sample["content"].encode("utf-8")).hexdigest()
+            shingles = self._shingles(sample["content"])
+
+            if content_hash in seen_hashes or (shingles and any(
+                len(shingles & other) / len(shingles | other) > duplicate_threshold
+                for other in kept_shingles
+            )):
+                print(f"Skipped duplicate sample {sample['path']}")
+                continue
+
+            seen_hashes.add(content_hash)
+            kept_shingles.append(shingles)
+            unique_samples.append(sample)
+
+        samples = unique_samples
+
+        # Drops the largest files until the remaining ones fit the total budget
+        sizes = {sample["path"]: len(sample["content"].encode('utf-8')) for sample in samples}
+        total_bytes = sum(sizes.values())
+        dropped_paths = set()
+
+        for sample in sorted(samples, key=lambda sample: sizes[sample["path"]], reverse=True):
+            if total_bytes <= max_total_bytes:
+                break
+
+            dropped_paths.add(sample["path"])
+            total_bytes -= sizes[sample["path"]]
+            print(f"Dropped {sample['path']} to fit the {max_total_bytes:,} byte budget")
+
+        samples = [sample for sample in samples if sample["path"] not in dropped_paths]
+
+        total_lines = sum(sample["lines"] for sample in samples)
+        print(f"\nTotal: {total_lines} lines of code read from {len(samples)} files.")
+        return samples
 
-        for filepath in filepaths:
-            try:
-                with open(filepath, 'r', encoding='utf-8') as file:
-                    content = file.read()
-                    lines = len(content.splitlines())
-                    total_lines += lines
-                    samples.append({
-                        "path": str(filepath.relative_to(self.repo_path)),
-                        "content": content,
-                        "lines": lines
-                    })
-
-                    print(f"Read {lines} lines from {filepath}")
+    def _shingles(self, content: str, size: int = 5) -> Set[int]:
+        """
+        Computes the hashed word shingles of a text for near-duplicate detection.
+        
+        Args:
+            content: Text to shingle
+            size: Number of consecutive words per shingle
+            
+        Returns:
+            Set of shingle hashes, empty if the text is shorter than a single shingle
+        """
+        words = content.split()
+        return {hash(tuple(words[i:i + size])) for i in range(len(words) - size + 1)}
 
-            except Exception as e:
-                print(f"Error reading {filepath.name}: {e}")
+    def _read_one(self, filepath: Path, max_bytes: int) -> Optional[Dict[str, any]]:
+        """
+        Reads the content of a single file, keeping only its head and tail when it is oversized.
         
-        print(f"\nTotal: {total_lines} lines of code read from {len(samples)} files.")
-        return samples
+        Args:
+            filepath: Path object to read
+            max_bytes: Size above which the file is truncated
+            
+        Returns:
+            Dictionary containing file path, content, and line count, or None if the file could not be read
+        """
+        try:
+            data = filepath.read_bytes()
+            lines = data.count(b"\n") + (0 if data.endswith(b"\n") or not data else 1)
+
+            if len(data) > max_bytes:
+                head_end = max_bytes // 2
+                tail_start = len(data) - max_bytes // 4
+
+                # Moves each cut off a split UTF-8 character, so only that partial character is dropped
+                for _ in range(3):
+                    if head_end > 0 and 0x80 <= data[head_end] < 0xC0:
+                        head_end -= 1
+                    if tail_start < len(data) and 0x80 <= data[tail_start] < 0xC0:
+                        tail_start += 1
+
+                content = (
+                    data[:head_end].decode('utf-8', errors='replace')
+                    + "\n# ... [truncated] ...\n"
+                    + data[tail_start:].decode('utf-8', errors='replace')
+                )
+                print(f"Read {lines} lines from {filepath} (truncated to head and tail)")
+            else:
+                content = data.decode('utf-8', errors='replace')
+                print(f"Read {lines} lines from {filepath}")
+
+            return {
+                "path": str(filepath.relative_to(self.repo_path)),
+                "content": content,
+                "lines": lines
+            }
+
+        except Exception as e:
+            print(f"Error reading {filepath.name}: {e}")
+            return None
     
-    def extraction(self, code_samples: List[Dict[str, any]]) -> str:
+    def _combine_samples(self, code_samples: List[Dict[str, any]]) -> str:
         """
-        Performs the initial stylistic extraction from the code samples.
+        Combines the code samples into a single string for LLM processing.
         
         Args:
             code_samples: List of dictionaries containing file information
             
         Returns:
-            Generated style guide as a string
+            Combined code samples as a string
         """
         # Prepares code for LLM processing
-        combined_code = "\n\n".join([
-            f"### File: {sample['path']}\n```python\n{sample['content']}\n```"
-            for sample in code_samples
-        ])
+        parts = []
+        for sample in code_samples:
+            parts.extend(("### File: ", sample['path'], "\n```python\n", sample['content'], "\n```", "\n\n"))
 
-        # Coding stylistic extraction prompt declaration
-        prompt = f"""I want you to analyze these Python files from a coding samples repository and create a comprehensive coding style guide.
+        # Joins every piece at once, dropping the trailing separator
+        combined_code = "".join(parts[:-1])
 
-IMPORTANT: These files are SAMPLES of my personal coding style. The specific application context is NOT part of my coding style. Focus ONLY on the coding patterns, conventions, and formatting choices that are consistent across all samples, regardless of what the code does.
+        return combined_code
 
-Your task is to:
-
-1. **Identify patterns and conventions** that appear consistently across all files
-2. **Create a detailed markdown style guide** that captures my personal and distinctive coding style patterns
-3. **Include specific snippet examples** from my actual code showing the STYLE, not the application logic
-4. **Make it prescriptive** so another AI could replicate my style exactly when writing ANY type of Python code
-
-Analyze these aspects:
+    def _build_prompt(self, combined_code: str, samples_heading: str = "Here are my Python code samples:") -> List[Dict[str, any]]:
+        """
+        Builds the coding stylistic extraction prompt around the combined samples.
+        
+        Args:
+            combined_code: Combined code samples (or per-file style summaries) to analyze
+            samples_heading: Heading introducing the combined samples in the prompt
+            
+        Returns:
+            Extraction prompt as a list of content blocks
+        """
+        return [
+            {"type": "text", "text": _CODE_PROMPT_PREFIX},
+            # No cache breakpoint: the rubric alone is below the minimum cacheable prompt length, and
+            # identical prompts are answered by the response cache before they reach the API
+            {"type": "text", "text": f"{samples_heading}\n\n{combined_code}{_CODE_PROMPT_SUFFIX}"}
+        ]
+
+    async def extraction(self, code_samples: List[Dict[str, any]]) -> str:
+        """
+        Performs the initial stylistic extraction from the code samples.
+        
+        Args:
+            code_samples: List of dictionaries containing file information
+            
+        Returns:
+            Generated style guide as a string
+        """
+        combined_code = self._combine_samples(code_samples)
+        prompt = self._build_prompt(combined_code)
+        embedding = None
+
+        # Reuses a previous draft when the samples are nearly identical to an earlier run, embedding
+        # them only when the exact-match response cache cannot answer the prompt
+        if self.semantic_cache is not None and self._cache_get(self._response_cache_key(prompt)) is None:
+            embedding = await asyncio.to_thread(
+                self.semantic_cache.embed,
+                [self._combine_samples([sample]) for sample in code_samples]
+            )
+            cached_draft = self.semantic_cache.lookup(embedding)
+
+            if cached_draft is not None:
+                print("\nReused a cached draft from near-identical code samples")
+                self.current_draft = cached_draft
+                self.save_draft()
+                return self.current_draft
 
-**Documentation:**
-- Docstring format (Google/NumPy/Sphinx style?)
-- What sections do I include? (Args, Returns, etc.)
-- Level of detail in docstrings
-- Module-level documentation patterns
-- How I describe parameters and return values
+        print("\nAnalyzing code samples with Claude Sonnet 4.5...")
+        draft = await self._synthesize(prompt)
 
-**Type Hints:**
-- Where and when do I use type annotations?
-- Always on function signatures? Sometimes on variables?
-- Complex types (Union, Optional, List, Dict patterns)
+        if embedding is not None:
+            self.semantic_cache.store(embedding, draft)
 
-**Naming Conventions:**
-- Variable naming (length, descriptiveness, patterns)
-- Function naming (verbs, patterns)
-- Class naming
-- Constants (if any)
-- Private/protected members (underscore usage)
+        return draft
 
-**Code Organization:**
-- Import ordering and grouping
-- Class structure (method ordering, organization)
-- File structure patterns
-- Global variables and constants placement
+    async def extraction_map_reduce(self, code_samples: List[Dict[str, any]], max_concurrency: int = 8) -> str:
+        """
+        Performs the stylistic extraction as a per-file map stage followed by a single reduce call.
+        
+        Args:
+            code_samples: List of dictionaries containing file information
+            max_concurrency: Maximum number of concurrent map requests
+            
+        Returns:
+            Generated style guide as a string
+        """
+        # Map stage: extracts the style features of each file concurrently
+        print(f"\nExtracting style features from {len(code_samples)} code samples with Claude Haiku 4.5...")
 
-**Comments:**
-- When do I add comments?
-- Inline vs block comments
-- Comment style and detail level
-- What do I explain vs what do I leave uncommented?
+        semaphore = asyncio.Semaphore(max_concurrency)
+        file_features = await asyncio.gather(*[
+            self._extract_file_features(sample, semaphore)
+            for sample in code_samples
+        ])
 
-**Code Style:**
-- Line length preferences
-- Indentation patterns
-- Blank line usage
-- String quotes (single vs double)
+        # Reduce stage: merges the per-file style features into the final draft
+        combined_features = "\n\n".join([
+            f"### File: {sample['path']}\n```json\n{features}\n```"
+            for sample, features in zip(code_samples, file_features)
+        ])
+        prompt = self._build_prompt(combined_features, samples_heading="Here are JSON summaries of the style features found in each of my Python code samples:")
 
-**Python Idioms:**
-- List/dict comprehensions usage
-- Use of decorators
-- Context managers
-- Generators and iterators
-- Exception handling patterns
+        print("\nMerging style features with Claude Sonnet 4.5...")
+        return await self._synthesize(prompt)
 
-**Distinctive Patterns:**
-- Any unique or characteristic patterns you notice
-- Preferred libraries or approaches
-- Code complexity preferences
-- How I structure error handling
-- Logging patterns
+    def _build_map_prompt(self, sample: Dict[str, any]) -> str:
+        """
+        Builds the compact per-file style feature extraction prompt.
+        
+        Args:
+            sample: Dictionary containing file information
+            
+        Returns:
+            Map prompt as a string
+        """
+        return _CODE_MAP_PROMPT_PREFIX + self._combine_samples([sample]) + _CODE_MAP_PROMPT_SUFFIX
 
-REMEMBER: Extract only the STYLE patterns that are consistent across samples. Do NOT include application-specific conventions. Focus on HOW I write code, not WHAT the code does.
+    async def _extract_file_features(self, sample: Dict[str, any], semaphore: asyncio.Semaphore) -> str:
+        """
+        Extracts the style features of a single code sample, reusing cached results for unchanged files.
+        
+        Args:
+            sample: Dictionary containing file information
+            semaphore: Semaphore capping the number of concurrent map requests
+            
+        Returns:
+            Style features as a JSON string
+        """
+        # Keys the cache on everything that shapes the response, so any change busts the entry
+        map_prompt = self._build_map_prompt(sample)
+        cache_key = hashlib.sha256(f"{self.map_model}|{self.map_max_tokens}|{map_prompt}".encode("utf-8")).hexdigest()
+        cache_file = self.cache_dir / "map" / f"{cache_key}.json"
 
-Here are my Python code samples:
+        if cache_file.exists():
+            try:
+                features = _json_loads(cache_file.read_bytes())["features"]
+                print(f"Reused cached style features for {sample['path']}")
+                return features
+            except Exception as e:
+                print(f"Error reading cache entry {cache_file.name}: {e}")
+
+        async with semaphore:
+            message = await self.client.messages.create(
+                model=self.map_model,
+                max_tokens=self.map_max_tokens,
+                messages=[{
+                    "role": "user",
+                    "content": map_prompt
+                }]
+            )
+        features = message.content[0].text
+
+        # Truncated features are still merged but never cached, so a later run can retry them
+        if message.stop_reason == "max_tokens":
+            print(f"Style features for {sample['path']} were cut off at {self.map_max_tokens:,} tokens and will not be cached")
+            return features
 
-{combined_code}
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            cache_file.write_bytes(_json_dumps({"path": sample["path"], "features": features}))
+        except Exception as e:
+            print(f"Error writing cache entry {cache_file.name}: {e}")
 
-Create a markdown document with clear sections, snippet examples showing STYLE patterns, and actionable rules.
-Format it as a professional style guide that could be given to a coding agent for writing ANY Python code in my style."""
+        print(f"Extracted style features from {sample['path']} ({message.usage.input_tokens:,} input tokens)")
+        return features
 
-        # Calls LLM API to generate a coding stylistic draft
-        print("\nAnalyzing code samples with Claude Sonnet 4.5...")
+    async def _synthesize(self, prompt: List[Dict[str, any]]) -> str:
+        """
+        Generates the coding stylistic draft from the prompt, saves it and records it in the conversation history.
         
-        message = self.client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=8000,
-            messages=[{
-                "role": "user",
-                "content": prompt
-            }]
-        )
+        Args:
+            prompt: Extraction prompt content blocks to send
+            
+        Returns:
+            Generated style guide as a string
+        """
+        # Reuses the cached draft when the same prompt was already sent with the same settings
+        cache_key = self._response_cache_key(prompt)
+        cached_response = self._cache_get(cache_key)
+
+        if cached_response is not None:
+            self.current_draft = cached_response["text"]
+            usage = cached_response["usage"]
+            self.save_draft()
+        else:
+            # Calls LLM API and streams the coding stylistic draft to a sibling file, replacing the
+            # previous draft only once the full response has arrived
+            partial_file = self.output_file + ".partial"
 
-        # Stores the draft and updates the conversation history
-        self.current_draft = message.content[0].text
+            try:
+                async with self.client.messages.stream(
+                    model=self.model,
+                    max_tokens=self.max_tokens,
+                    messages=[{
+                        "role": "user",
+                        "content": prompt
+                    }]
+                ) as stream:
+                    with open(partial_file, 'w', encoding='utf-8', buffering=131072) as f:
+                        async for text in stream.text_stream:
+                            f.write(text)
+                    message = await stream.get_final_message()
+            except Exception:
+                if os.path.exists(partial_file):
+                    os.remove(partial_file)
+                raise
+
+            os.replace(partial_file, self.output_file)
+            print(f"Saved draft to: {self.output_file}")
+            self.current_draft = message.content[0].text
+            usage = {
+                "input_tokens": message.usage.input_tokens,
+                "output_tokens": message.usage.output_tokens,
+                "cache_read_input_tokens": message.usage.cache_read_input_tokens or 0,
+                "cache_creation_input_tokens": message.usage.cache_creation_input_tokens or 0
+            }
+            self._cache_set(cache_key, self.current_draft, usage)
+
+        # Updates the conversation history, compressing the prompt since it is only needed for follow-up turns
         self.conversation_history.append({
             "role": "user",
-            "content": prompt
+            "content_gz": gzip.compress(_json_dumps(prompt))
         })
         self.conversation_history.append({
             "role": "assistant",
@@ -207,40 +702,255 @@ Format it as a professional style guide that could be given to a coding agent fo
         })
 
         # Displays statistics
-        print(f"\nCoding stylistic draft generated")
-        print(f"  Input tokens: {message.usage.input_tokens:,}")
-        print(f"  Output tokens: {message.usage.output_tokens:,}")
+        if cached_response is not None:
+            print(f"\nCoding stylistic draft loaded from cache (no tokens billed)")
+        else:
+            print(f"\nCoding stylistic draft generated")
+        print(f"  Input tokens: {usage['input_tokens']:,}")
+        print(f"  Output tokens: {usage['output_tokens']:,}")
+        print(f"  Prompt cache read tokens: {usage.get('cache_read_input_tokens', 0):,}")
+        print(f"  Prompt cache write tokens: {usage.get('cache_creation_input_tokens', 0):,}")
         
         return self.current_draft
+
+    def get_conversation_history(self) -> List[Dict[str, any]]:
+        """
+        Retrieves the conversation history as API-ready messages, decompressing stored prompts.
+        
+        Returns:
+            List of message dictionaries with role and content
+        """
+        messages = []
+
+        for turn in self.conversation_history:
+            if "content_gz" in turn:
+                content = _json_loads(gzip.decompress(turn["content_gz"]))
+            else:
+                content = turn["content"]
+
+            messages.append({"role": turn["role"], "content": content})
+
+        return messages
+
+    def _response_cache_key(self, prompt: List[Dict[str, any]]) -> str:
+        """
+        Computes the response cache key of a synthesis prompt.
+        
+        Args:
+            prompt: Extraction prompt content blocks
+            
+        Returns:
+            SHA-256 hex digest of the model, max tokens and prompt text
+        """
+        prompt_text = "".join(block["text"] for block in prompt)
+        return hashlib.sha256(f"{self.model}|{self.max_tokens}|{prompt_text}".encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[Dict[str, any]]:
+        """
+        Retrieves a cached API response.
+        
+        Args:
+            key: Cache key of the response
+            
+        Returns:
+            Dictionary containing the response text and token usage, or None if not cached
+        """
+        cache_file = self.cache_dir / f"{key}.json"
+
+        if not cache_file.exists():
+            return None
+
+        try:
+            return _json_loads(cache_file.read_bytes())
+        except Exception as e:
+            print(f"Error reading cache entry {cache_file.name}: {e}")
+            return None
+
+    def _cache_set(self, key: str, text: str, usage: Dict[str, int]) -> None:
+        """
+        Stores an API response in the cache.
+        
+        Args:
+            key: Cache key of the response
+            text: Response text to store
+            usage: Token usage of the original API call
+        """
+        cache_file = self.cache_dir / f"{key}.json"
+
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            cache_file.write_bytes(_json_dumps({"text": text, "usage": usage}))
+        except Exception as e:
+            print(f"Error writing cache entry {cache_file.name}: {e}")
+
+    async def extraction_batch(self, samples_per_job: List[List[Dict[str, any]]], poll_interval: int = 30) -> List[Optional[str]]:
+        """
+        Performs the stylistic extraction for several jobs through the Message Batches API.
+        
+        Args:
+            samples_per_job: List of code sample lists, one per extraction job
+            poll_interval: Seconds to wait between batch status checks
+            
+        Returns:
+            List of generated style guides, with None for jobs that did not succeed
+        """
+        total_jobs = len(samples_per_job)
+        drafts: List[Optional[str]] = [None] * total_jobs
+        cache_keys = []
+        requests = []
+
+        # Reuses cached drafts and builds one batch request per remaining extraction job
+        for index, code_samples in enumerate(samples_per_job):
+            prompt = self._build_prompt(self._combine_samples(code_samples))
+            cache_keys.append(self._response_cache_key(prompt))
+            cached_response = self._cache_get(cache_keys[index])
+
+            if cached_response is not None:
+                print(f"Job job-{index} loaded from cache (no tokens billed)")
+                drafts[index] = cached_response["text"]
+                self.save_draft(drafts[index], self._job_output_file(index, total_jobs))
+                continue
+
+            requests.append({
+                "custom_id": f"job-{index}",
+                "params": {
+                    "model": self.model,
+                    "max_tokens": self.max_tokens,
+                    "messages": [{
+                        "role": "user",
+                        "content": prompt
+                    }]
+                }
+            })
+
+        input_tokens = 0
+        output_tokens = 0
+
+        if requests:
+            # Submits the batch and waits until it has finished processing
+            print(f"\nSubmitting {len(requests)} coding stylistic extraction job(s) as a message batch...")
+
+            batch = await self.client.messages.batches.create(requests=requests)
+            print(f"  Batch ID: {batch.id}")
+
+            while batch.processing_status != "ended":
+                await asyncio.sleep(poll_interval)
+                batch = await self.client.messages.batches.retrieve(batch.id)
+                print(f"  Status: {batch.processing_status} ({batch.request_counts.succeeded} succeeded, {batch.request_counts.processing} processing)")
+
+            # Collects the results, which are not guaranteed to follow the request order
+            async for response in await self.client.messages.batches.results(batch.id):
+                index = int(response.custom_id.removeprefix("job-"))
+
+                if response.result.type != "succeeded":
+                    print(f"Job {response.custom_id} did not succeed: {response.result.type}")
+                    continue
+
+                message = response.result.message
+                drafts[index] = message.content[0].text
+                input_tokens += message.usage.input_tokens
+                output_tokens += message.usage.output_tokens
+
+                self._cache_set(cache_keys[index], drafts[index], {
+                    "input_tokens": message.usage.input_tokens,
+                    "output_tokens": message.usage.output_tokens,
+                    "cache_read_input_tokens": message.usage.cache_read_input_tokens or 0,
+                    "cache_creation_input_tokens": message.usage.cache_creation_input_tokens or 0
+                })
+                self.save_draft(drafts[index], self._job_output_file(index, total_jobs))
+
+        if len(drafts) == 1:
+            self.current_draft = drafts[0]
+
+        # Displays statistics
+        print(f"\nCoding stylistic batch completed: {sum(draft is not None for draft in drafts)}/{len(drafts)} drafts generated")
+        print(f"  Input tokens: {input_tokens:,}")
+        print(f"  Output tokens: {output_tokens:,}")
+
+        return drafts
+
+    def _job_output_file(self, index: int, total_jobs: int) -> str:
+        """
+        Resolves the output file path for a batch extraction job.
+        
+        Args:
+            index: Index of the job within the batch
+            total_jobs: Total number of jobs in the batch
+            
+        Returns:
+            Output file path for the job
+        """
+        if total_jobs == 1:
+            return self.output_file
+
+        root, ext = os.path.splitext(self.output_file)
+        return f"{root}_job-{index}{ext}"
     
-    def save_draft(self, content: str = None) -> None:
+    def save_draft(self, content: str = None, output_file: str = None) -> None:
         """
         Saves the current draft to a file.
         
         Args:
             content: Content to save (defaults to self.current_draft)
+            output_file: Path where the content will be saved (defaults to self.output_file)
         """
         if content is None:
             content = self.current_draft
+
+        if output_file is None:
+            output_file = self.output_file
             
         if content is None:
             print("No content to save!")
             return
             
         try:
-            with open(self.output_file, 'w', encoding='utf-8') as f:
+            with open(output_file, 'w', encoding='utf-8', buffering=131072) as f:
                 f.write(content)
-            print(f"Saved draft to: {self.output_file}")
+            print(f"Saved draft to: {output_file}")
         except Exception as e:
             print(f"Error saving file: {e}")
 
 
-def main() -> None:
+async def main() -> None:
     """
     Main execution function.
     """
+    # Parses command line arguments
+    parser = argparse.ArgumentParser(description="Extracts a coding style guide from the code samples.")
+    mode_group = parser.add_mutually_exclusive_group()
+    mode_group.add_argument(
+        "--realtime",
+        action="store_true",
+        help="Performs the extraction with a synchronous API call instead of the Message Batches API"
+    )
+    mode_group.add_argument(
+        "--map-reduce",
+        action="store_true",
+        help="Performs concurrent per-file extractions merged by a final synchronous API call"
+    )
+    parser.add_argument(
+        "--semantic-cache",
+        action="store_true",
+        help="Reuses drafts of near-identical samples in realtime mode (requires numpy, voyageai and VOYAGE_API_KEY)"
+    )
+    parser.add_argument(
+        "--max-bytes-per-file",
+        type=int,
+        default=16384,
+        help="Size above which a sample file is truncated to its head and tail"
+    )
+    args = parser.parse_args()
+
+    if args.max_bytes_per_file < 1024:
+        parser.error("--max-bytes-per-file must be at least 1024")
+
+    if args.semantic_cache and not args.realtime:
+        parser.error("--semantic-cache is only supported with --realtime")
+
     # Configuration
     MAX_FILES = 20
+    MAX_TOTAL_BYTES = 512 * 1024
     CODE_SAMPLES_DIR = "code_samples"
     SKILL_SET_DIR = "skill_set"
     OUTPUT_FILE = os.path.join(SKILL_SET_DIR, "coding_stylistic_guide.md")
@@ -264,7 +974,8 @@ def main() -> None:
     # Initializes the utility class
     extractor_utils = StylisticExtractorUtils(
         code_repository_path=CODE_SAMPLES_DIR,
-        output_file_path=OUTPUT_FILE
+        output_file_path=OUTPUT_FILE,
+        semantic_cache=args.semantic_cache
     )
 
     # Step 1: Scans repository for code files
@@ -278,19 +989,25 @@ def main() -> None:
         return
     
     # Step 2: Reads code files
-    code_samples = extractor_utils.read_files(code_files)
+    code_samples = extractor_utils.read_files(
+        code_files,
+        max_bytes_per_file=args.max_bytes_per_file,
+        max_total_bytes=MAX_TOTAL_BYTES
+    )
 
     if not code_samples:
         print("\nNo code samples could be read from the files.")
         return
     
-    # Step 3: Performs the coding stylistic extraction
-    draft = extractor_utils.extraction(code_samples)
-
-    # Step 4: Saves the draft
-    extractor_utils.save_draft()
+    # Step 3: Performs the coding stylistic extraction and saves the draft
+    if args.realtime:
+        draft = await extractor_utils.extraction(code_samples)
+    elif args.map_reduce:
+        draft = await extractor_utils.extraction_map_reduce(code_samples)
+    else:
+        drafts = await extractor_utils.extraction_batch([code_samples])
 
     print(f"\nCoding stylistic extraction complete")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file